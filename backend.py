@@ -4,11 +4,15 @@ from firebase_admin import credentials, auth, firestore, storage
 import random
 import datetime
 import uuid
+import threading
+import time
 from google.cloud import speech, texttospeech
 from google.cloud import language_v1 # NEW: Import the Natural Language library
 import tempfile
 import os
 import google.generativeai as genai
+from rate_limits import RATE_LIMITS, UPSTREAM_LIMITS, ConcurrencyLimiter, RateLimiter, UpstreamBusy
+from empathy_pool import CandidatePool, POOL_MAX_AGE_DAYS
 
 # --- Initialization ---
 app = Flask(__name__)
@@ -43,6 +47,102 @@ def generate_anonymous_username():
     return f"{random.choice(adjectives)}{random.choice(nouns)}{random.randint(100, 999)}"
 
 
+# --- ============================== ---
+# --- RATE LIMITING & ADMISSION      ---
+# --- ============================== ---
+# The limiters live in rate_limits.py; these helpers turn them into responses.
+
+rate_limiter = RateLimiter(RATE_LIMITS)
+upstream_limiters = {name: ConcurrencyLimiter(name, *limits) for name, limits in UPSTREAM_LIMITS.items()}
+
+
+def rate_limit_response(endpoint, uid):
+    """
+    Takes a token from the caller's bucket for this endpoint.
+    Returns a 429 response if the bucket is empty, otherwise None.
+    Call this after validating the request, so bad requests don't use up the caller's quota.
+    Note the uid is whatever the client sends; it isn't verified against Firebase Auth.
+    """
+    retry_after = rate_limiter.acquire(endpoint, f"uid:{uid}")
+    if retry_after:
+        return jsonify({"error": "Too many requests. Please slow down."}), 429, {"Retry-After": str(retry_after)}
+    return None
+
+
+def upstream_busy_response(e):
+    """Builds the 503 response for an UpstreamBusy error."""
+    return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+
+
+# --- ============================== ---
+# --- EMPATHY ENGINE CANDIDATE POOL  ---
+# --- ============================== ---
+# The pool itself lives in empathy_pool.py; this part keeps it filled from Firestore.
+
+POOL_REFRESH_SECONDS = 300         # How often the background refresh runs
+POOL_REFRESH_LIMIT = 500           # Max recent posts read per refresh
+
+candidate_pool = CandidatePool()
+candidate_pool_refresher_started = False
+candidate_pool_refresher_lock = threading.Lock()
+
+
+def refresh_candidate_pool():
+    """
+    Rebuilds the candidate pool from the newest posts in Firestore.
+    We read the latest POOL_REFRESH_LIMIT posts in the age window and filter on
+    sentiment in Python, so this only needs the single-field timestamp index.
+    Each refresh costs up to POOL_REFRESH_LIMIT reads per process.
+    """
+    scan_started = datetime.datetime.utcnow()
+    cutoff = scan_started - datetime.timedelta(days=POOL_MAX_AGE_DAYS)
+    posts_ref = (
+        db.collection('posts')
+        .where('timestamp', '>=', cutoff)
+        .order_by('timestamp', direction=firestore.Query.DESCENDING)
+        .limit(POOL_REFRESH_LIMIT)
+    )
+    posts = []
+    for doc in posts_ref.stream():
+        post = doc.to_dict()
+        post['id'] = doc.id
+        posts.append(post)
+
+    candidate_pool.replace(posts, scan_started)
+    print(f"Candidate pool refreshed: {candidate_pool.size()} posts")
+
+
+def candidate_pool_refresher():
+    """Background loop that keeps the candidate pool up to date."""
+    while True:
+        time.sleep(POOL_REFRESH_SECONDS)
+        try:
+            refresh_candidate_pool()
+        except Exception as e:
+            print(f"Could not refresh candidate pool: {e}")
+
+
+@app.before_request
+def start_candidate_pool_refresher():
+    """
+    Fills the candidate pool and starts the refresher thread, once per serving process.
+    This runs on the first request rather than at import time, so the reloader's
+    parent process (which never serves requests) and plain imports don't poll Firestore.
+    The first fill is synchronous so that request doesn't see an empty pool.
+    """
+    global candidate_pool_refresher_started
+    if candidate_pool_refresher_started:
+        return
+    with candidate_pool_refresher_lock:
+        if not candidate_pool_refresher_started:
+            try:
+                refresh_candidate_pool()
+            except Exception as e:
+                print(f"Could not refresh candidate pool: {e}")
+            threading.Thread(target=candidate_pool_refresher, daemon=True).start()
+            candidate_pool_refresher_started = True
+
+
 # --- ============================== ---
 # --- USER & PUBLIC DIARY ENDPOINTS  ---
 # --- ============================== ---
@@ -91,15 +191,23 @@ def create_post():
     if not uid or not username or not content:
         return jsonify({"error": "User ID, username, and content are required."}), 400
 
+    limited = rate_limit_response("create_post", uid)
+    if limited:
+        return limited
+
     # --- NEW: Sentiment Analysis Step ---
     sentiment_score = 0.0
     sentiment_magnitude = 0.0
     try:
         document = language_v1.Document(content=content, type_=language_v1.Document.Type.PLAIN_TEXT)
-        sentiment = language_client.analyze_sentiment(document=document).document_sentiment
+        with upstream_limiters["language"].slot():
+            sentiment = language_client.analyze_sentiment(document=document).document_sentiment
         sentiment_score = sentiment.score
         sentiment_magnitude = sentiment.magnitude
         print(f"Sentiment analyzed: Score={sentiment_score}, Magnitude={sentiment_magnitude}")
+    except UpstreamBusy as e:
+        # Don't save the post with a made-up score when we're overloaded; let the client retry.
+        return upstream_busy_response(e)
     except Exception as e:
         print(f"Could not analyze sentiment: {e}")
         # If sentiment analysis fails, we still save the post, just without the scores.
@@ -114,7 +222,8 @@ def create_post():
     }
     
     try:
-        db.collection('posts').add(post_data)
+        _, post_ref = db.collection('posts').add(post_data)
+        candidate_pool.add({**post_data, "id": post_ref.id})
         return jsonify({"message": "Post created and analyzed successfully!"}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -136,6 +245,10 @@ def create_echo():
     if not uid:
         return jsonify({"error": "User ID is required"}), 400
 
+    limited = rate_limit_response("create_echo", uid)
+    if limited:
+        return limited
+
     temp_filename = None
     try:
         # 1. Save ORIGINAL audio to a cross-platform temporary file
@@ -164,7 +277,8 @@ def create_echo():
                 language_code="en-US"
             )
 
-        response = speech_client.recognize(config=config, audio=audio)
+        with upstream_limiters["speech"].slot():
+            response = speech_client.recognize(config=config, audio=audio)
         
         if not response.results:
             return jsonify({"error": "Could not understand audio. The audio might be silent or in an unsupported format."}), 400
@@ -174,7 +288,8 @@ def create_echo():
         synthesis_input = texttospeech.SynthesisInput(text=transcript)
         voice = texttospeech.VoiceSelectionParams(language_code="en-US", ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL)
         audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
-        response = tts_client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
+        with upstream_limiters["tts"].slot():
+            response = tts_client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
         anonymized_audio_content = response.audio_content
 
         # 4. Upload ANONYMOUS audio to Firebase Storage
@@ -195,6 +310,8 @@ def create_echo():
 
         return jsonify({"message": "Echo created successfully!", "url": blob.public_url}), 201
 
+    except UpstreamBusy as e:
+        return upstream_busy_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
@@ -236,17 +353,22 @@ def get_recommendation(post_id):
     """
     Finds a supportive and relevant post for a user who has just submitted a negative post.
     This is the core of the Empathy Engine.
+    Query parameters: `content` (the user's post) and `uid` (the requesting user, used for rate limiting).
     """
     try:
         # 1. Fetch the user's negative post
         # Note: In a real app, we'd get the post from the DB. For speed, we'll get content from the request.
         negative_content = request.args.get('content')
-        if not negative_content:
-            return jsonify({"error": "Original post content is required."}), 400
+        uid = request.args.get('uid')
+        if not negative_content or not uid:
+            return jsonify({"error": "Original post content and user ID are required."}), 400
+
+        limited = rate_limit_response("get_recommendation", uid)
+        if limited:
+            return limited
 
-        # 2. Fetch a list of recent, highly POSITIVE posts from the database
-        positive_posts_ref = db.collection('posts').where('sentiment_score', '>', 0.7).order_by('sentiment_score', direction=firestore.Query.DESCENDING).limit(10)
-        positive_posts = [doc.to_dict() for doc in positive_posts_ref.stream()]
+        # 2. Sample recent, highly POSITIVE posts from the in-memory candidate pool
+        positive_posts = candidate_pool.sample(negative_content)
 
         if not positive_posts:
             return jsonify({"recommendation": "No suitable positive posts found right now."}), 200
@@ -268,7 +390,8 @@ def get_recommendation(post_id):
         Respond with ONLY the number of the post you choose (e.g., "Post 3"). Do not add any other words or explanation.
         """
         
-        response = model.generate_content(prompt)
+        with upstream_limiters["gemini"].slot():
+            response = model.generate_content(prompt)
         
         # 4. Extract the chosen post and return it
         chosen_post_text = response.text.strip() # e.g., "Post 3"
@@ -278,10 +401,29 @@ def get_recommendation(post_id):
 
         return jsonify({"recommendation": recommended_post}), 200
 
+    except UpstreamBusy as e:
+        return upstream_busy_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# --- ============================== ---
+# --- STATS                          ---
+# --- ============================== ---
+
+@app.route('/stats/limits', methods=['GET'])
+def get_limit_stats():
+    """Reports the current state of the rate limiter and upstream concurrency limits."""
+    return jsonify({
+        "rate_limits": rate_limiter.stats(),
+        "upstreams": {name: limiter.stats() for name, limiter in upstream_limiters.items()},
+    }), 200
+
+
 if __name__ == '__main__':
+    # Warm the candidate pool straight away in the process that serves requests
+    # (with the reloader on, that's the child, where WERKZEUG_RUN_MAIN is set).
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_candidate_pool_refresher()
     app.run(debug=True, port=5001, use_reloader=True, reloader_type="stat")
 
@@ -0,0 +1,180 @@
+"""
+In-memory candidate pool for the Empathy Engine.
+
+Instead of querying Firestore on every recommendation request, backend.py keeps
+a pool of recent positive posts, bucketed by topic. create_post adds new
+positive posts as they are written, and a background thread rebuilds the pool
+from Firestore every few minutes so other instances' posts show up too.
+
+Nothing in here talks to Google or Firebase, so it can be imported and tested
+on its own.
+"""
+import datetime
+import math
+import random
+import re
+import threading
+
+POSITIVE_SENTIMENT_THRESHOLD = 0.7
+POOL_MAX_AGE_DAYS = 30             # Posts older than this drop out of the pool
+POOL_BUCKET_SIZE = 50              # Max posts kept per topic bucket
+RECENCY_HALF_LIFE_HOURS = 72       # A post's weight halves every 3 days
+RECOMMENDATION_CANDIDATES = 10     # How many posts we show to Gemini
+REFRESH_OVERLAP_SECONDS = 60       # Posts added this soon before a refresh scan survive the swap
+
+TOPIC_KEYWORDS = {
+    "work": ["work", "job", "boss", "career", "office", "deadline", "interview", "promotion"],
+    "school": ["school", "exam", "study", "class", "college", "university", "grade", "homework"],
+    "family": ["family", "mom", "dad", "mother", "father", "parent", "sister", "brother", "kids"],
+    "relationships": ["friend", "partner", "boyfriend", "girlfriend", "love", "breakup", "lonely", "alone"],
+    "health": ["health", "sick", "sleep", "tired", "anxiety", "stress", "therapy", "exercise"],
+    "loss": ["loss", "lost", "grief", "died", "passed away", "miss", "funeral"],
+}
+GENERAL_TOPIC = "general"
+TOPICS = list(TOPIC_KEYWORDS) + [GENERAL_TOPIC]
+
+WORD_PATTERN = re.compile(r"[a-z']+")
+
+# Single words are looked up in the post's set of words; multi-word phrases
+# like "passed away" are matched separately on word boundaries.
+TOPIC_WORDS = {
+    topic: {keyword for keyword in keywords if " " not in keyword}
+    for topic, keywords in TOPIC_KEYWORDS.items()
+}
+TOPIC_PHRASES = {
+    topic: [
+        re.compile(r"\b" + r"\s+".join(map(re.escape, keyword.split())) + r"\b")
+        for keyword in keywords if " " in keyword
+    ]
+    for topic, keywords in TOPIC_KEYWORDS.items()
+}
+
+
+def classify_topics(text):
+    """Returns the list of topic buckets a piece of text belongs to."""
+    lowered = text.lower()
+    words = set(WORD_PATTERN.findall(lowered))
+    topics = [
+        topic for topic in TOPIC_KEYWORDS
+        if words & TOPIC_WORDS[topic] or any(phrase.search(lowered) for phrase in TOPIC_PHRASES[topic])
+    ]
+    return topics or [GENERAL_TOPIC]
+
+
+def post_age_hours(post, now):
+    """Returns how many hours ago a post was written (Firestore returns tz-aware timestamps)."""
+    timestamp = post.get("timestamp")
+    if not isinstance(timestamp, datetime.datetime):
+        return float("inf")
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return max((now - timestamp).total_seconds() / 3600, 0.0)
+
+
+def is_pool_candidate(post, now):
+    """Checks whether a post is positive and recent enough to be recommended."""
+    return bool(
+        post.get("content")
+        and post.get("sentiment_score", 0.0) > POSITIVE_SENTIMENT_THRESHOLD
+        and post_age_hours(post, now) <= POOL_MAX_AGE_DAYS * 24
+    )
+
+
+def post_key(post):
+    """Identifies a post across buckets (freshly created posts always carry their Firestore id)."""
+    return post.get("id") or id(post)
+
+
+def build_candidate_pool(posts, now):
+    """Groups candidate posts into topic buckets, newest first, capped per bucket."""
+    pool = {topic: [] for topic in TOPICS}
+    for post in sorted(posts, key=lambda p: post_age_hours(p, now)):
+        if not is_pool_candidate(post, now):
+            continue
+        for topic in classify_topics(post["content"]):
+            if len(pool[topic]) < POOL_BUCKET_SIZE:
+                pool[topic].append(post)
+    return pool
+
+
+def post_weight(post, now):
+    """Sampling weight: sentiment score, halved every RECENCY_HALF_LIFE_HOURS."""
+    return post.get("sentiment_score", 0.0) * math.pow(0.5, post_age_hours(post, now) / RECENCY_HALF_LIFE_HOURS)
+
+
+class CandidatePool:
+    """Thread-safe topic buckets of recent positive posts."""
+
+    def __init__(self):
+        self.buckets = {topic: [] for topic in TOPICS}
+        self.lock = threading.Lock()
+
+    def add(self, post, now=None):
+        """Adds a freshly created post if it qualifies."""
+        now = now or datetime.datetime.utcnow()
+        if not is_pool_candidate(post, now):
+            return
+        with self.lock:
+            for topic in classify_topics(post["content"]):
+                bucket = self.buckets[topic]
+                bucket.insert(0, post)
+                del bucket[POOL_BUCKET_SIZE:]
+
+    def replace(self, posts, scan_started, now=None):
+        """
+        Swaps in a pool rebuilt from a Firestore scan that started at scan_started.
+        Posts added to the pool since just before the scan are kept, since the scan
+        may not have seen them yet.
+        """
+        now = now or datetime.datetime.utcnow()
+        max_age_hours = (now - scan_started).total_seconds() / 3600 + REFRESH_OVERLAP_SECONDS / 3600
+        with self.lock:
+            scanned = {post_key(post) for post in posts}
+            recent = [
+                post for bucket in self.buckets.values() for post in bucket
+                if post_key(post) not in scanned and post_age_hours(post, now) <= max_age_hours
+            ]
+            unique_recent = list({post_key(post): post for post in recent}.values())
+            self.buckets = build_candidate_pool(list(posts) + unique_recent, now)
+
+    def size(self):
+        with self.lock:
+            return len({post_key(post) for bucket in self.buckets.values() for post in bucket})
+
+    def sample(self, text, k=RECOMMENDATION_CANDIDATES, now=None):
+        """
+        Picks up to k positive posts for the given text.
+        Posts from matching topic buckets are preferred, then other buckets fill the rest.
+        Within each group, posts are drawn by weight (recency decay x sentiment) and we
+        avoid showing the same author twice (unless there aren't enough authors) so the
+        list stays diverse.
+        """
+        now = now or datetime.datetime.utcnow()
+        topics = set(classify_topics(text))
+        with self.lock:
+            matching = {post_key(post): post for topic in topics for post in self.buckets[topic]}
+            others = {
+                post_key(post): post
+                for topic, bucket in self.buckets.items() if topic not in topics
+                for post in bucket
+            }
+        for key in matching:
+            others.pop(key, None)
+
+        chosen, repeats, authors = [], [], set()
+        for group in (matching, others):
+            remaining = list(group.values())
+            while remaining and len(chosen) < k:
+                weights = [post_weight(post, now) for post in remaining]
+                if sum(weights) > 0:
+                    post = random.choices(remaining, weights=weights)[0]
+                else:
+                    post = random.choice(remaining)
+                remaining.remove(post)
+                if post.get("author_uid") in authors:
+                    repeats.append(post)
+                    continue
+                authors.add(post.get("author_uid"))
+                chosen.append(post)
+        # Only fall back to repeat authors if there weren't enough distinct ones
+        return chosen + repeats[:k - len(chosen)]
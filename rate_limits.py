@@ -0,0 +1,163 @@
+"""
+Rate limiting and admission control for the expensive AI endpoints.
+
+Every request to the AI endpoints costs money and holds a Flask worker thread
+while Google's APIs respond. backend.py limits each uid with a token bucket per
+endpoint (rejected with 429), and caps how many calls can be in flight to each
+upstream client at once, with a small bounded wait queue (rejected with 503).
+
+Nothing in here talks to Flask or Google, so it can be imported and tested on its own.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+RATE_LIMITS = {
+    # endpoint: (bucket capacity, tokens refilled per second)
+    "create_echo": (3, 1 / 60),           # Bursts of 3, then 1 echo per minute
+    "create_post": (5, 1 / 20),           # Bursts of 5, then 1 post every 20 seconds
+    "get_recommendation": (5, 1 / 30),    # Bursts of 5, then 1 every 30 seconds
+}
+MAX_RATE_LIMIT_BUCKETS = 10000            # Least recently used buckets are dropped past this many
+
+UPSTREAM_LIMITS = {
+    # upstream: (max concurrent calls, max waiting callers, max wait in seconds)
+    "speech": (4, 4, 2.0),
+    "tts": (4, 4, 2.0),
+    "language": (8, 8, 1.0),
+    "gemini": (4, 4, 2.0),
+}
+
+
+class UpstreamBusy(Exception):
+    """Raised when an upstream client has no free slot within the allowed wait."""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"The {upstream} service is busy right now. Please try again shortly.")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by (endpoint, key), e.g. ("create_post", "uid:abc").
+    Buckets are kept in least-recently-used order and the oldest one is dropped once
+    there are more than max_buckets, so memory and per-call work stay bounded.
+    """
+
+    def __init__(self, limits, max_buckets=MAX_RATE_LIMIT_BUCKETS, clock=time.monotonic):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.clock = clock
+        self.buckets = OrderedDict()  # (endpoint, key) -> [tokens, last_refill]
+        self.tracked = {endpoint: 0 for endpoint in limits}
+        self.allowed = {endpoint: 0 for endpoint in limits}
+        self.rejected = {endpoint: 0 for endpoint in limits}
+        self.evicted = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, endpoint, key):
+        """Takes a token. Returns 0 if allowed, otherwise seconds until the next token."""
+        capacity, rate = self.limits[endpoint]
+        now = self.clock()
+        with self.lock:
+            bucket = self.buckets.get((endpoint, key))
+            if bucket is None:
+                bucket = self.buckets[(endpoint, key)] = [capacity, now]
+                self.tracked[endpoint] += 1
+                while len(self.buckets) > self.max_buckets:
+                    (evicted_endpoint, _), _ = self.buckets.popitem(last=False)
+                    self.tracked[evicted_endpoint] -= 1
+                    self.evicted += 1
+            else:
+                self.buckets.move_to_end((endpoint, key))
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed[endpoint] += 1
+                return 0
+            self.rejected[endpoint] += 1
+            return math.ceil((1 - bucket[0]) / rate)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "max_buckets": self.max_buckets,
+                "evicted": self.evicted,
+                "endpoints": {
+                    endpoint: {
+                        "capacity": capacity,
+                        "refill_per_second": rate,
+                        "tracked_keys": self.tracked[endpoint],
+                        "allowed": self.allowed[endpoint],
+                        "rejected": self.rejected[endpoint],
+                    }
+                    for endpoint, (capacity, rate) in self.limits.items()
+                },
+            }
+
+
+class ConcurrencyLimiter:
+    """
+    Caps in-flight calls to one upstream client, with a bounded wait queue.
+    Waiters get slots in arrival order, and new callers queue behind them
+    rather than grabbing a freed slot first, so waits stay predictable.
+    """
+
+    def __init__(self, name, max_concurrent, max_waiting, max_wait_seconds):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.max_wait_seconds = max_wait_seconds
+        self.active = 0
+        self.queue = deque()  # One ticket per waiting caller, oldest first
+        self.completed = 0
+        self.rejected = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        with self.condition:
+            if self.active >= self.max_concurrent or self.queue:
+                # Reject straight away if the queue is full, so tail latency stays bounded
+                if len(self.queue) >= self.max_waiting:
+                    self.rejected += 1
+                    raise UpstreamBusy(self.name, math.ceil(self.max_wait_seconds))
+                ticket = object()
+                self.queue.append(ticket)
+                try:
+                    has_slot = self.condition.wait_for(
+                        lambda: self.active < self.max_concurrent and self.queue[0] is ticket,
+                        self.max_wait_seconds,
+                    )
+                finally:
+                    self.queue.remove(ticket)
+                    # The head of the queue changed, so let the next waiter re-check
+                    self.condition.notify_all()
+                if not has_slot:
+                    self.rejected += 1
+                    raise UpstreamBusy(self.name, math.ceil(self.max_wait_seconds))
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.completed += 1
+                self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_waiting": self.max_waiting,
+                "max_wait_seconds": self.max_wait_seconds,
+                "active": self.active,
+                "waiting": len(self.queue),
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
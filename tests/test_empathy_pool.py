@@ -0,0 +1,115 @@
+import datetime
+import random
+
+import pytest
+
+from empathy_pool import (
+    GENERAL_TOPIC,
+    POOL_BUCKET_SIZE,
+    CandidatePool,
+    build_candidate_pool,
+    classify_topics,
+)
+
+NOW = datetime.datetime(2026, 1, 1, 12, 0, 0)
+
+
+def make_post(post_id, content, score=0.9, hours_ago=1, author=None):
+    return {
+        "id": post_id,
+        "author_uid": author or f"author-{post_id}",
+        "content": content,
+        "sentiment_score": score,
+        "timestamp": NOW - datetime.timedelta(hours=hours_ago),
+    }
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("I love this classic movie", ["relationships"]),
+    ("for example, nothing at all", [GENERAL_TOPIC]),
+    ("I lost my gloves", ["loss"]),
+    ("The mission was dismissed", [GENERAL_TOPIC]),
+    ("So much homework", ["school"]),
+    ("My boss praised my work", ["work"]),
+    ("My grandma passed away", ["loss"]),
+    ("My grandma passed   Away", ["loss"]),
+    ("Nothing passed, away we go", [GENERAL_TOPIC]),
+    ("My mom came to my exam", ["school", "family"]),
+])
+def test_classify_topics_matches_whole_words_and_phrases(text, expected):
+    assert sorted(classify_topics(text)) == sorted(expected)
+
+
+def test_build_candidate_pool_filters_and_orders_newest_first():
+    posts = [
+        make_post("old", "work is fine", hours_ago=24 * 31),
+        make_post("sad", "work is awful", score=0.1),
+        make_post("older", "work is great", hours_ago=5),
+        make_post("newer", "work is great", hours_ago=1),
+    ]
+    pool = build_candidate_pool(posts, NOW)
+    assert [post["id"] for post in pool["work"]] == ["newer", "older"]
+    assert pool["school"] == []
+
+
+def test_build_candidate_pool_caps_each_bucket():
+    posts = [make_post(str(i), "great job", hours_ago=i) for i in range(POOL_BUCKET_SIZE + 10)]
+    pool = build_candidate_pool(posts, NOW)
+    assert len(pool["work"]) == POOL_BUCKET_SIZE
+    assert pool["work"][0]["id"] == "0"
+
+
+def test_add_ignores_negative_posts():
+    pool = CandidatePool()
+    pool.add(make_post("sad", "bad day", score=0.2), now=NOW)
+    pool.add(make_post("happy", "good day"), now=NOW)
+    assert pool.size() == 1
+
+
+def test_replace_keeps_posts_added_during_the_scan():
+    pool = CandidatePool()
+    scan_started = NOW - datetime.timedelta(seconds=5)
+    stale = make_post("stale", "great day", hours_ago=2)
+    fresh = make_post("fresh", "great day", hours_ago=0)
+    pool.add(stale, now=NOW)
+    pool.add(fresh, now=NOW)
+
+    pool.replace([make_post("scanned", "great day")], scan_started, now=NOW)
+
+    ids = {post["id"] for post in pool.sample("anything", k=10, now=NOW)}
+    assert ids == {"scanned", "fresh"}
+
+
+def test_sample_prefers_matching_topics():
+    random.seed(0)
+    pool = CandidatePool()
+    for i in range(5):
+        pool.add(make_post(f"work-{i}", "my new job rocks"), now=NOW)
+        pool.add(make_post(f"family-{i}", "dinner with my family"), now=NOW)
+
+    chosen = pool.sample("I hate my boss", k=5, now=NOW)
+    assert {post["id"] for post in chosen} == {f"work-{i}" for i in range(5)}
+
+
+def test_sample_fills_from_other_topics_without_duplicates():
+    random.seed(0)
+    pool = CandidatePool()
+    pool.add(make_post("both", "my family helped me with my job"), now=NOW)
+    pool.add(make_post("family", "dinner with my family"), now=NOW)
+
+    chosen = pool.sample("I hate my boss", k=10, now=NOW)
+    assert [post["id"] for post in chosen][0] == "both"
+    assert sorted(post["id"] for post in chosen) == ["both", "family"]
+
+
+def test_sample_avoids_repeat_authors_until_it_runs_out():
+    random.seed(0)
+    pool = CandidatePool()
+    for i in range(4):
+        pool.add(make_post(f"a-{i}", "great job", author="alice"), now=NOW)
+    pool.add(make_post("b-0", "great job", author="bob"), now=NOW)
+
+    chosen = pool.sample("my job", k=3, now=NOW)
+    assert len(chosen) == 3
+    assert {post["author_uid"] for post in chosen[:2]} == {"alice", "bob"}
+    assert chosen[2]["author_uid"] == "alice"
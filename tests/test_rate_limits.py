@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+
+from rate_limits import ConcurrencyLimiter, RateLimiter, UpstreamBusy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_limiter(max_buckets=100):
+    clock = FakeClock()
+    limiter = RateLimiter({"echo": (2, 0.5), "post": (1, 0.1)}, max_buckets=max_buckets, clock=clock)
+    return limiter, clock
+
+
+def test_bucket_allows_a_burst_then_reports_retry_after():
+    limiter, _ = make_limiter()
+    assert limiter.acquire("echo", "uid:a") == 0
+    assert limiter.acquire("echo", "uid:a") == 0
+    assert limiter.acquire("echo", "uid:a") == 2  # 1 token at 0.5 tokens/second
+    stats = limiter.stats()["endpoints"]["echo"]
+    assert (stats["allowed"], stats["rejected"], stats["tracked_keys"]) == (2, 1, 1)
+
+
+def test_bucket_refills_over_time_up_to_capacity():
+    limiter, clock = make_limiter()
+    limiter.acquire("echo", "uid:a")
+    limiter.acquire("echo", "uid:a")
+    clock.now += 2
+    assert limiter.acquire("echo", "uid:a") == 0
+    assert limiter.acquire("echo", "uid:a") > 0
+    clock.now += 3600
+    assert [limiter.acquire("echo", "uid:a") for _ in range(3)] == [0, 0, 2]
+
+
+def test_buckets_are_separate_per_endpoint_and_key():
+    limiter, _ = make_limiter()
+    assert limiter.acquire("post", "uid:a") == 0
+    assert limiter.acquire("post", "uid:a") == 10
+    assert limiter.acquire("post", "uid:b") == 0
+    assert limiter.acquire("echo", "uid:a") == 0
+
+
+def test_bucket_count_is_a_hard_bound_with_lru_eviction():
+    limiter, _ = make_limiter(max_buckets=3)
+    for uid in ["a", "b", "c"]:
+        limiter.acquire("post", f"uid:{uid}")
+    limiter.acquire("post", "uid:a")  # "a" is now the most recently used
+    for i in range(50):
+        limiter.acquire("post", f"uid:rotating-{i}")
+        assert len(limiter.buckets) <= 3
+
+    stats = limiter.stats()
+    assert stats["evicted"] == 50
+    assert stats["endpoints"]["post"]["tracked_keys"] == 3
+
+
+def test_lru_eviction_keeps_recently_used_buckets():
+    limiter, _ = make_limiter(max_buckets=2)
+    limiter.acquire("post", "uid:a")
+    limiter.acquire("post", "uid:b")
+    limiter.acquire("post", "uid:a")
+    limiter.acquire("post", "uid:c")  # evicts "b", not "a"
+    assert ("post", "uid:a") in limiter.buckets
+    assert ("post", "uid:b") not in limiter.buckets
+    assert limiter.acquire("post", "uid:a") > 0
+
+
+def hold_slot(limiter, release, results):
+    try:
+        with limiter.slot():
+            release.wait(5)
+            results.append("ok")
+    except UpstreamBusy:
+        results.append("busy")
+
+
+def test_concurrency_limiter_rejects_immediately_when_queue_is_full():
+    limiter = ConcurrencyLimiter("gemini", max_concurrent=1, max_waiting=0, max_wait_seconds=5)
+    release, results = threading.Event(), []
+    holder = threading.Thread(target=hold_slot, args=(limiter, release, results))
+    holder.start()
+    while limiter.stats()["active"] == 0:
+        time.sleep(0.001)
+
+    started = time.monotonic()
+    with pytest.raises(UpstreamBusy) as excinfo:
+        with limiter.slot():
+            pass
+    assert time.monotonic() - started < 0.5
+    assert excinfo.value.retry_after == 5
+
+    release.set()
+    holder.join()
+    assert results == ["ok"]
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_concurrency_limiter_rejects_after_wait_timeout():
+    limiter = ConcurrencyLimiter("speech", max_concurrent=1, max_waiting=1, max_wait_seconds=0.05)
+    release, results = threading.Event(), []
+    holder = threading.Thread(target=hold_slot, args=(limiter, release, results))
+    holder.start()
+    while limiter.stats()["active"] == 0:
+        time.sleep(0.001)
+
+    with pytest.raises(UpstreamBusy):
+        with limiter.slot():
+            pass
+    assert limiter.stats()["waiting"] == 0
+
+    release.set()
+    holder.join()
+
+
+def test_concurrency_limiter_hands_slot_to_a_waiter():
+    limiter = ConcurrencyLimiter("tts", max_concurrent=1, max_waiting=1, max_wait_seconds=5)
+    release, results = threading.Event(), []
+    holder = threading.Thread(target=hold_slot, args=(limiter, release, results))
+    holder.start()
+    while limiter.stats()["active"] == 0:
+        time.sleep(0.001)
+
+    threading.Timer(0.05, release.set).start()
+    with limiter.slot():
+        results.append("waiter")
+    holder.join()
+    assert results == ["ok", "waiter"]
+    assert limiter.stats()["completed"] == 2
+
+
+def test_concurrency_limiter_serves_waiters_before_later_callers():
+    limiter = ConcurrencyLimiter("language", max_concurrent=1, max_waiting=2, max_wait_seconds=5)
+    results = []
+
+    def call(name):
+        with limiter.slot():
+            results.append(name)
+
+    waiter = threading.Thread(target=call, args=("waiter",))
+    with limiter.slot():
+        waiter.start()
+        while limiter.stats()["waiting"] == 0:
+            time.sleep(0.001)
+    # The slot was just freed and this thread asks again before the waiter wakes up;
+    # it must queue behind the waiter instead of taking the slot.
+    call("latecomer")
+    waiter.join()
+    assert results == ["waiter", "latecomer"]